@@ -1,9 +1,20 @@
+import hashlib
 import os
-from flask import Flask, render_template, request, redirect, url_for, flash
+import sqlite3
+import click
+from flask import Flask, render_template, stream_template, request, redirect, url_for, flash, abort, g, has_request_context, get_flashed_messages, make_response, session
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask_caching import Cache
+from sqlalchemy import event, func, inspect, or_, text, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.orm import joinedload, raiseload, selectinload
+from werkzeug.security import check_password_hash
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
-import json
+import orjson
 from datetime import datetime
 
 # Initialize the Flask application
@@ -11,8 +22,57 @@ app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your_super_secret_key_here'
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///database.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Share pooled connections across worker threads instead of reopening the file
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    'poolclass': QueuePool,
+    'pool_size': 5,
+    'connect_args': {'check_same_thread': False},
+    # Room for every distinct statement the app compiles (the default is 500)
+    'query_cache_size': 1200,
+    # JSON columns are encoded and decoded with orjson
+    'json_serializer': lambda obj: orjson.dumps(obj).decode(),
+    'json_deserializer': orjson.loads,
+}
 db = SQLAlchemy(app)
 
+# In-process cache for public page data
+app.config['CACHE_TYPE'] = 'SimpleCache'
+app.config['CACHE_DEFAULT_TIMEOUT'] = 300
+cache = Cache(app)
+
+# WAL lets readers proceed while a write is in progress
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute('PRAGMA temp_store=MEMORY')
+    cursor.execute('PRAGMA mmap_size=268435456')
+    cursor.close()
+
+# Number of posts rendered per feed page
+FEED_PAGE_SIZE = 20
+
+# Requests issuing more queries than this are logged as likely N+1 regressions
+QUERY_COUNT_WARNING = 10
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def count_queries(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.query_count = g.get('query_count', 0) + 1
+
+@app.after_request
+def log_query_count(response):
+    query_count = g.get('query_count', 0)
+    if query_count > QUERY_COUNT_WARNING:
+        app.logger.warning('%s %s issued %d queries', request.method, request.path, query_count)
+    return response
+
+# Argon2id hasher shared by every password operation
+password_hasher = PasswordHasher(time_cost=2, memory_cost=65536, parallelism=1)
+
 # Setup Flask-Login
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -20,51 +80,113 @@ login_manager.login_view = 'login'
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    # The dashboard, plan and portfolio views all read current_user.portfolio,
+    # so fetch it in the same query
+    return db.session.get(User, int(user_id), options=[joinedload(User.portfolio)])
 
 # Database Models
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(80), unique=True, nullable=False)
-    email = db.Column(db.String(120), unique=True, nullable=False)
+    username = db.Column(db.String(80), unique=True, nullable=False, index=True)
+    email = db.Column(db.String(120), unique=True, nullable=False, index=True)
     password_hash = db.Column(db.String(128))
     subscription_type = db.Column(db.String(20), default='Free')
     profile_photo = db.Column(db.String(200), default='https://thumbs.dreamstime.com/b/default-avatar-profile-icon-vector-social-media-user-image-182145777.jpg')
     bio = db.Column(db.Text, default='A new user on Quick4lio.')
-    social_links = db.Column(db.Text, default='{}') # Stored as JSON string
+    social_links = db.Column(db.JSON, default=dict)
     
-    posts = db.relationship('Post', backref='author', lazy='dynamic')
+    posts = db.relationship('Post', back_populates='author', order_by='Post.created_at.desc()')
     portfolio = db.relationship('Portfolio', backref='owner', uselist=False)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        # Accounts created before the switch to Argon2 still hold Werkzeug hashes
+        if not self.password_hash.startswith('$argon2'):
+            return check_password_hash(self.password_hash, password)
+        try:
+            return password_hasher.verify(self.password_hash, password)
+        except (VerificationError, InvalidHashError):
+            return False
+
+    def password_needs_rehash(self):
+        if not self.password_hash.startswith('$argon2'):
+            return True
+        return password_hasher.check_needs_rehash(self.password_hash)
 
 class Post(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     content_text = db.Column(db.Text, nullable=False)
     content_image = db.Column(db.String(200)) # URL from Cloudinary
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    author = db.relationship('User', back_populates='posts')
 
 class Portfolio(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), unique=True, nullable=False)
     portfolio_type = db.Column(db.String(20), nullable=False, default='Free')
-    sections_data = db.Column(db.Text, default='{}') # Stored as JSON string
+    sections_data = db.Column(db.JSON, default=dict)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
-# Create database tables
-with app.app_context():
+# Create database tables. The web process runs this once at startup, before
+# gunicorn forks its workers (see Procfile), instead of every worker doing it on
+# import. It is idempotent, so running it on every start is safe.
+def init_db():
     db.create_all()
+    # create_all() skips existing tables, so add indexes introduced after the first release
+    with db.engine.begin() as conn:
+        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_post_created_at ON post (created_at)'))
+        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_post_user_id ON post (user_id)'))
+        if 'updated_at' not in {c['name'] for c in inspect(conn).get_columns('portfolio')}:
+            conn.execute(text('ALTER TABLE portfolio ADD COLUMN updated_at DATETIME'))
+
+@app.cli.command('init-db')
+def init_db_command():
+    init_db()
+    click.echo('Initialized the database.')
+
+# Apply eager loads to a query. In debug mode every other relationship raises on
+# access, so a template touching something we didn't load fails immediately
+# instead of quietly issuing a query per row.
+def strict_load(query, *loads):
+    if app.debug:
+        return query.options(*loads, raiseload('*'))
+    return query.options(*loads)
 
-# Utility function for parsing JSON from database
-def parse_json(data):
-    try:
-        return json.loads(data)
-    except (json.JSONDecodeError, TypeError):
-        return {}
+# Cached data for the public pages. Only plain values are cached, not rendered
+# HTML, because the navbar and flashed messages differ per visitor. Callers pass
+# a version that changes whenever the underlying rows do, so stale entries are
+# never read and simply expire.
+def _user_summary(user):
+    return {'id': user.id, 'username': user.username, 'profile_photo': user.profile_photo, 'bio': user.bio}
+
+@cache.memoize()
+def _user_profile_context(username, latest_post_id):
+    user = strict_load(User.query, selectinload(User.posts)).filter_by(username=username).first()
+    if not user:
+        return None
+    posts = [
+        {'content_text': post.content_text, 'content_image': post.content_image, 'created_at': post.created_at}
+        for post in user.posts
+    ]
+    return {'user': _user_summary(user), 'posts': posts, 'social_links': user.social_links or {}}
+
+@cache.memoize()
+def _public_portfolio_context(username, portfolio_id, updated_at):
+    user = strict_load(User.query, joinedload(User.portfolio)).filter_by(username=username).first()
+    if not user:
+        return None
+    portfolio = user.portfolio
+    if not portfolio:
+        return {'user': _user_summary(user), 'portfolio': None, 'sections_data': {}}
+    return {
+        'user': _user_summary(user),
+        'portfolio': {'portfolio_type': portfolio.portfolio_type},
+        'sections_data': portfolio.sections_data or {},
+    }
 
 # --- Routes ---
 
@@ -76,8 +198,30 @@ def index():
 # Home Page with posts feed
 @app.route('/feed')
 def feed():
-    posts = Post.query.order_by(Post.created_at.desc()).all()
-    return render_template('feed.html', posts=posts)
+    # Select only the columns the feed renders. Rows come back as plain tuples, so
+    # there are no Post/User objects to hydrate and no relationships to load.
+    query = db.session.query(
+        Post.id, Post.content_text, Post.content_image, Post.created_at,
+        User.username, User.profile_photo,
+    ).join(User, User.id == Post.user_id)
+    # Keyset pagination: each page starts below the oldest post of the previous
+    # one, so deep pages cost an index seek rather than an ever-growing OFFSET.
+    # The cursor is (created_at, id) so posts sharing a timestamp aren't skipped.
+    before = request.args.get('before', type=datetime.fromisoformat)
+    before_id = request.args.get('before_id', type=int)
+    if before and before_id is not None:
+        query = query.filter(tuple_(Post.created_at, Post.id) < (before, before_id))
+    # Fetch one extra row only to learn whether an older page exists
+    posts = query.order_by(Post.created_at.desc(), Post.id.desc()).limit(FEED_PAGE_SIZE + 1).all()
+    next_cursor = None
+    if len(posts) > FEED_PAGE_SIZE:
+        posts = posts[:FEED_PAGE_SIZE]
+        next_cursor = {'before': posts[-1].created_at.isoformat(), 'before_id': posts[-1].id}
+    # The page is streamed, so session writes made while rendering would miss the
+    # already-sent Set-Cookie header. Pop flashes and load the user up front.
+    get_flashed_messages()
+    current_user._get_current_object()
+    return app.response_class(stream_template('feed.html', posts=posts, before=before, next_cursor=next_cursor))
 
 # User registration
 @app.route('/register', methods=['GET', 'POST'])
@@ -87,14 +231,21 @@ def register():
         email = request.form.get('email')
         password = request.form.get('password')
         
-        if User.query.filter_by(username=username).first() or User.query.filter_by(email=email).first():
+        existing = User.query.with_entities(User.id).filter(or_(User.username == username, User.email == email)).first()
+        if existing:
             flash('Username or Email already exists.', 'danger')
             return redirect(url_for('register'))
 
         new_user = User(username=username, email=email)
         new_user.set_password(password)
         db.session.add(new_user)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Lost a race with a concurrent registration for the same name or email
+            db.session.rollback()
+            flash('Username or Email already exists.', 'danger')
+            return redirect(url_for('register'))
         flash('Account created successfully! You can now log in.', 'success')
         return redirect(url_for('login'))
     return render_template('register.html')
@@ -108,6 +259,10 @@ def login():
         user = User.query.filter_by(username=username).first()
 
         if user and user.check_password(password):
+            # Upgrade legacy or outdated hashes while we have the plaintext
+            if user.password_needs_rehash():
+                user.set_password(password)
+                db.session.commit()
             login_user(user)
             flash('Logged in successfully.', 'success')
             return redirect(url_for('dashboard'))
@@ -151,10 +306,13 @@ def create_post():
 # Profile page
 @app.route('/user/<username>')
 def user_profile(username):
-    user = User.query.filter_by(username=username).first_or_404()
-    posts = user.posts.order_by(Post.created_at.desc()).all()
-    social_links = parse_json(user.social_links)
-    return render_template('user_profile.html', user=user, posts=posts, social_links=social_links)
+    # A new post changes the user's latest post id, which moves the cache key
+    version = db.session.query(User.id, func.max(Post.id).label('latest_post_id')) \
+        .outerjoin(Post).filter(User.username == username).group_by(User.id).first_or_404()
+    context = _user_profile_context(username, version.latest_post_id)
+    if not context:
+        abort(404)
+    return render_template('user_profile.html', **context)
 
 # Route to show plan details and comparison
 @app.route('/plan-details')
@@ -170,16 +328,92 @@ def select_plan(plan_type):
         flash("Invalid plan selected.", "danger")
         return redirect(url_for('plan_details'))
         
+    portfolio = current_user.portfolio
+    
+    # Re-selecting the current plan is a no-op, so skip the write and commit
+    if current_user.subscription_type == plan_type and (not portfolio or portfolio.portfolio_type == plan_type):
+        flash(f'You are already on the {plan_type} plan.', 'info')
+        return redirect(url_for('dashboard'))
+    
     current_user.subscription_type = plan_type
     
-    if current_user.portfolio:
-        current_user.portfolio.portfolio_type = plan_type
+    if portfolio:
+        portfolio.portfolio_type = plan_type
     
+    # Both changes go out in a single flush and transaction
     db.session.commit()
     
     flash(f'Your plan has been successfully updated to {plan_type}!', 'success')
     return redirect(url_for('dashboard'))
 
+# Portfolio section builders, one per plan. Each reads only the form fields its
+# plan's editor submits.
+def _build_free_sections(form):
+    data = {
+        'header': {
+            'name': form.get('name'),
+            'title': form.get('title'),
+            'tagline': form.get('tagline')
+        },
+        'about': {
+            'bio': form.get('bio'),
+            'experience_years': form.get('experience_years'),
+            'location': form.get('location')
+        },
+        'projects': [],
+        'skills': {
+            'technical': form.get('technical_skills'),
+            'soft': form.get('soft_skills')
+        },
+        'contact': {
+            'email': form.get('contact_email'),
+            'phone': form.get('contact_phone'),
+            'linkedin': form.get('linkedin_url'),
+            'github': form.get('github_url'),
+            'website': form.get('website_url')
+        }
+    }
+    
+    # Handle multiple projects (up to 3)
+    for i in range(1, 4):  # Projects 1, 2, 3
+        project_name = form.get(f'project_name_{i}')
+        if project_name:  # Only add if project has a name
+            project = {
+                'name': project_name,
+                'desc': form.get(f'project_desc_{i}'),
+                'image': form.get(f'project_img_{i}'),
+                'technologies': form.get(f'project_tech_{i}'),
+                'url': form.get(f'project_url_{i}'),
+                'github': form.get(f'project_github_{i}')
+            }
+            data['projects'].append(project)
+    return data
+
+def _build_paid_sections(form):
+    data = _build_free_sections(form)
+    data['paid_pages'] = {
+        'home_content': form.get('home_content')
+    }
+    return data
+
+def _build_premium_sections(form):
+    data = _build_paid_sections(form)
+    data['premium_pages'] = {
+        'case_studies': form.get('case_studies'),
+        'testimonials': form.get('testimonials'),
+        'resume_link': form.get('resume_link'),
+        'awards': form.get('awards'),
+        'services': form.get('services'),
+        'hourly_rate': form.get('hourly_rate')
+    }
+    return data
+
+_SECTION_BUILDERS = {
+    'Free': _build_free_sections,
+    'Paid': _build_paid_sections,
+    'Premium': _build_premium_sections,
+}
+
 # Unified route to create/edit portfolio and save data
 @app.route('/edit-portfolio', methods=['GET', 'POST'])
 @login_required
@@ -191,71 +425,16 @@ def edit_portfolio():
         
         # Check if portfolio exists, if not, create one
         if not user_portfolio:
-            user_portfolio = Portfolio(user_id=current_user.id, portfolio_type=portfolio_type, sections_data='{}')
+            user_portfolio = Portfolio(user_id=current_user.id, portfolio_type=portfolio_type, sections_data={})
             db.session.add(user_portfolio)
             db.session.commit()
         
         # Now we know a portfolio object exists
         user_portfolio.portfolio_type = portfolio_type
         
-        # Build the data structure based on the new enhanced form
-        data = {
-            'header': {
-                'name': request.form.get('name'),
-                'title': request.form.get('title'),
-                'tagline': request.form.get('tagline')
-            },
-            'about': {
-                'bio': request.form.get('bio'),
-                'experience_years': request.form.get('experience_years'),
-                'location': request.form.get('location')
-            },
-            'projects': [],
-            'skills': {
-                'technical': request.form.get('technical_skills'),
-                'soft': request.form.get('soft_skills')
-            },
-            'contact': {
-                'email': request.form.get('contact_email'),
-                'phone': request.form.get('contact_phone'),
-                'linkedin': request.form.get('linkedin_url'),
-                'github': request.form.get('github_url'),
-                'website': request.form.get('website_url')
-            }
-        }
-        
-        # Handle multiple projects (up to 3)
-        for i in range(1, 4):  # Projects 1, 2, 3
-            project_name = request.form.get(f'project_name_{i}')
-            if project_name:  # Only add if project has a name
-                project = {
-                    'name': project_name,
-                    'desc': request.form.get(f'project_desc_{i}'),
-                    'image': request.form.get(f'project_img_{i}'),
-                    'technologies': request.form.get(f'project_tech_{i}'),
-                    'url': request.form.get(f'project_url_{i}'),
-                    'github': request.form.get(f'project_github_{i}')
-                }
-                data['projects'].append(project)
-        
-        # Handle paid features
-        if portfolio_type in ['Paid', 'Premium']:
-            data['paid_pages'] = {
-                'home_content': request.form.get('home_content')
-            }
-        
-        # Handle premium features
-        if portfolio_type == 'Premium':
-            data['premium_pages'] = {
-                'case_studies': request.form.get('case_studies'),
-                'testimonials': request.form.get('testimonials'),
-                'resume_link': request.form.get('resume_link'),
-                'awards': request.form.get('awards'),
-                'services': request.form.get('services'),
-                'hourly_rate': request.form.get('hourly_rate')
-            }
-        
-        user_portfolio.sections_data = json.dumps(data)
+        # Only read the form fields the chosen plan actually uses
+        build_sections = _SECTION_BUILDERS.get(portfolio_type, _build_free_sections)
+        user_portfolio.sections_data = build_sections(request.form)
         db.session.commit()
         
         flash('Portfolio updated successfully!', 'success')
@@ -266,11 +445,11 @@ def edit_portfolio():
     
     # Ensure a portfolio exists before attempting to read its data
     if not user_portfolio:
-        user_portfolio = Portfolio(user_id=current_user.id, portfolio_type=plan, sections_data='{}')
+        user_portfolio = Portfolio(user_id=current_user.id, portfolio_type=plan, sections_data={})
         db.session.add(user_portfolio)
         db.session.commit()
     
-    sections_data = parse_json(user_portfolio.sections_data)
+    sections_data = user_portfolio.sections_data or {}
     
     if plan == 'Free':
         return render_template('edit_free_portfolio.html', sections_data=sections_data, portfolio=user_portfolio)
@@ -288,23 +467,48 @@ def edit_portfolio():
 # Public portfolio page
 @app.route('/p/<username>')
 def public_portfolio(username):
-    user = User.query.filter_by(username=username).first_or_404()
-    portfolio = user.portfolio
+    # Edits and plan changes bump Portfolio.updated_at, which moves the cache key
+    version = db.session.query(User.id, Portfolio.id.label('portfolio_id'), Portfolio.updated_at).select_from(User) \
+        .outerjoin(Portfolio).filter(User.username == username).first_or_404()
+
+    # The navbar differs per visitor, so the viewer is part of the ETag too
+    updated_at = version.updated_at.isoformat() if version.updated_at else ''
+    etag = hashlib.md5(f'{version.id}:{version.portfolio_id}:{updated_at}:{current_user.get_id()}'.encode()).hexdigest()
+    # Pending flashed messages must still be rendered, so never skip those
+    if etag in request.if_none_match and '_flashes' not in session:
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+
+    context = _public_portfolio_context(username, version.portfolio_id, version.updated_at)
+    if not context:
+        abort(404)
+    user = context['user']
+    portfolio = context['portfolio']
+    sections_data = context['sections_data']
 
     if not portfolio:
-        return render_template('public_portfolio.html', user=user, portfolio=None)
-    
-    sections_data = parse_json(portfolio.sections_data)
-    
-    if portfolio.portfolio_type == 'Free':
-        return render_template('free_portfolio.html', user=user, portfolio=portfolio, sections_data=sections_data)
-    elif portfolio.portfolio_type == 'Paid':
-        return render_template('paid_portfolio.html', user=user, portfolio=portfolio, sections_data=sections_data)
-    elif portfolio.portfolio_type == 'Premium':
-        return render_template('premium_portfolio.html', user=user, portfolio=portfolio, sections_data=sections_data)
-    
-    return render_template('public_portfolio.html', user=user, portfolio=None)
+        page = render_template('public_portfolio.html', user=user, portfolio=None)
+    elif portfolio['portfolio_type'] == 'Free':
+        page = render_template('free_portfolio.html', user=user, portfolio=portfolio, sections_data=sections_data)
+    elif portfolio['portfolio_type'] == 'Paid':
+        page = render_template('paid_portfolio.html', user=user, portfolio=portfolio, sections_data=sections_data)
+    elif portfolio['portfolio_type'] == 'Premium':
+        page = render_template('premium_portfolio.html', user=user, portfolio=portfolio, sections_data=sections_data)
+    else:
+        page = render_template('public_portfolio.html', user=user, portfolio=None)
+
+    response = make_response(page)
+    response.set_etag(etag)
+    if version.updated_at:
+        response.last_modified = version.updated_at
+    # Browsers must revalidate (cheaply, via the ETag) rather than reuse the page
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
 
 # To run the app:
 if __name__ == '__main__':
+    with app.app_context():
+        init_db()
     app.run(debug=True)
\ No newline at end of file